@@ -104,11 +104,10 @@ class VehicleScraper:
         
         if self.should_skip_file(output_file):
             self.logger.info(f"Skipping page {page_num} - recent file exists")
-            with open(output_file, 'r', encoding='utf-8') as file:
+            with open(output_file, 'rb') as file:
                 print(f"Processing {output_file}...")
                 html_content = file.read()
-                data = yad2_parser.extract_json_from_html(html_content)
-                listings_data = data['props']['pageProps']['dehydratedState']['queries'][0]['state']['data']
+                listings_data = yad2_parser.extract_listings_from_html(html_content)
                 return listings_data["pagination"]["pages"]
             
         try:
@@ -126,8 +125,7 @@ class VehicleScraper:
 
             assert len(response.content) > 50000 and b'__NEXT_DATA__' in response.content, len(response.content)
              
-            data = yad2_parser.extract_json_from_html(response.content.decode("utf-8"))
-            listings_data = data['props']['pageProps']['dehydratedState']['queries'][0]['state']['data']
+            listings_data = yad2_parser.extract_listings_from_html(response.content)
             with open(output_file, 'wb') as f:
                 f.write(response.content)
                 
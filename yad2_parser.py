@@ -1,41 +1,206 @@
 import re
 import json
+import orjson
 import csv
-from typing import List, Dict
-from datetime import datetime
-from bs4 import BeautifulSoup
+from typing import List, Dict, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, date
 import os
 from pathlib import Path
 
 today = datetime.now().date().strftime("%y_%m_%d")
 
-def extract_json_from_html(html_content: str) -> Dict:
-    """Extract JSON data from __NEXT_DATA__ script tag"""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    script_tag = soup.find('script', id='__NEXT_DATA__')
+# Matches the __NEXT_DATA__ script tag directly on the raw HTML bytes
+# (the id may be double-quoted, single-quoted or unquoted, with optional
+# whitespace around "=" and before the closing ">")
+_NEXT_RE = re.compile(rb'<script[^>]*\sid\s*=\s*(["\']?)__NEXT_DATA__\1(?=[\s/>])[^>]*>(?P<json>.*?)</script\s*>',
+                      re.DOTALL | re.IGNORECASE)
+
+# Matches the horsepower figure in subModel text
+_HP_RE = re.compile(r'(\d+)\s*כ״ס')
+
+# Output file buffer size (1 MiB), so the summary goes out in few large writes
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Columns of the summary CSV, in output order
+HEADERS = ['adNumber', 'price', 'city', 'adType', 'model', 'subModel', 
+           'productionDate', 'km', 'hand', 'createdAt', 'updatedAt', 
+           'rebouncedAt', 'listingType', 'number_of_years', 'km_per_year', 'description', 'link', 'make', 'hp']
+
+# Hebrew month names to numbers mapping
+MONTH_MAP = {
+    'ינואר': 1, 'פברואר': 2, 'מרץ': 3, 'אפריל': 4,
+    'מאי': 5, 'יוני': 6, 'יולי': 7, 'אוגוסט': 8,
+    'ספטמבר': 9, 'אוקטובר': 10, 'נובמבר': 11, 'דצמבר': 12
+}
+
+# Listing groups found on each results page, in the order they are written
+LISTING_TYPES = ['commercial', 'private', 'solo', 'platinum']
+
+def _decode_next_data(html_content: Union[str, bytes]) -> Tuple[Dict, bool]:
+    """Decode the __NEXT_DATA__ payload; the flag is True if the stdlib fallback was used"""
+    if isinstance(html_content, str):
+        html_content = html_content.encode('utf-8')
     
-    if script_tag is None:
+    # Pull the JSON literal out without building a DOM
+    m = _NEXT_RE.search(html_content)
+    if m is None:
         raise ValueError("Could not find __NEXT_DATA__ script tag in HTML")
         
-    return json.loads(script_tag.string)
+    payload = m.group('json')
+    try:
+        return orjson.loads(payload), False
+    except orjson.JSONDecodeError:
+        # orjson is stricter than the stdlib (e.g. it rejects lone surrogate
+        # escapes left by truncated emoji), so retry with json
+        return json.loads(payload), True
+
+def _listings_from_data(data: Dict) -> Dict:
+    # Only this subtree of the page state is used
+    return data['props']['pageProps']['dehydratedState']['queries'][0]['state']['data']
+
+def extract_json_from_html(html_content: Union[str, bytes]) -> Dict:
+    """Extract JSON data from __NEXT_DATA__ script tag"""
+    return _decode_next_data(html_content)[0]
+
+def extract_listings_from_html(html_content: Union[str, bytes]) -> Dict:
+    """Extract the listings query data from the __NEXT_DATA__ payload"""
+    return _listings_from_data(extract_json_from_html(html_content))
 
 def get_month_number(month_text: str) -> int:
-    # Hebrew month names to numbers mapping
-    month_mapping = {
-        'ינואר': 1, 'פברואר': 2, 'מרץ': 3, 'אפריל': 4,
-        'מאי': 5, 'יוני': 6, 'יולי': 7, 'אוגוסט': 8,
-        'ספטמבר': 9, 'אוקטובר': 10, 'נובמבר': 11, 'דצמבר': 12
-    }
-    return month_mapping.get(month_text, 1)  # Default to 1 if month not found
-
-def calculate_years_since_production(production_year: int, production_month: int) -> float:
-    production_date = datetime(production_year, production_month, 1)
-    current_date = datetime.now()
-    years = (current_date - production_date).days / 365.25
-    return years
-
-def process_vehicle_data(json_list: List[Dict], listing_type: str, output_file: str, mode: str = 'w', debug: bool = False) -> None:
-    """Process vehicle data and write to CSV"""
+    return MONTH_MAP.get(month_text, 1)  # Default to 1 if month not found
+
+def calculate_years_since_production(production_year: int, production_month: int, current_ordinal: int) -> float:
+    # Whole days between the two dates, same as (now - production_date).days
+    days = current_ordinal - date(production_year, production_month, 1).toordinal()
+    return days / 365.25
+
+def _row_from_item(item: Dict, listing_type: str, current_date: str, now_ordinal: int) -> Optional[tuple]:
+    """Build the CSV row for one listing, or None if it has no price"""
+    # Get ad number - use orderId as fallback
+    ad_number = item.get('orderId', item.get('token', 'unknown'))
+    
+    # Skip if price is 0 or missing (likely "contact dealer" listings)
+    price = item.get('price', 0)
+    if price == 0:
+        return None
+    
+    # Look up required vehicle fields once; a missing one raises KeyError
+    vehicle_dates = item['vehicleDates']
+    model = item['model']['text']
+    sub_model = item['subModel']['text']
+    make = item['manufacturer']['text']
+    token = item['token']
+    
+    # Create date string in YYYY-MM-DD format for production date
+    year: int = vehicle_dates['yearOfProduction']
+    month_data = vehicle_dates.get('monthOfProduction', {"text": "ינואר"})
+    month: int = MONTH_MAP.get(month_data.get('text'), 1)
+    production_date = f"{year}-{month:02d}-01"
+    
+    # Calculate years since production
+    years_since_production: float = calculate_years_since_production(year, month, now_ordinal)
+    
+    # Handle missing km field - use 0 as default
+    # Note: km field doesn't exist in this data structure
+    km: int = item.get('km', 0)
+    
+    # Calculate km per year (handle division by zero)
+    if years_since_production > 0 and km > 0:
+        km_per_year = round(km / years_since_production, 2)
+    else:
+        km_per_year = 0
+    
+    # Extract HP from subModel text
+    hp_match = _HP_RE.search(sub_model)
+    hp: int = int(hp_match.group(1)) if hp_match else 0
+    
+    # Get city - handle different address structures
+    city = ''
+    if 'address' in item:
+        # A null address raises TypeError here and the item is skipped
+        address = item['address']
+        if 'city' in address:
+            city = address['city'].get('text', '')
+        elif 'area' in address:
+            city = address['area'].get('text', '')
+    
+    # Get description from metaData if available
+    description = item.get('metaData', {}).get('description', '')
+    
+    # Fields must stay in the same order as headers
+    row = (
+        ad_number,
+        price,
+        city,
+        item.get('adType', ''),
+        model,
+        sub_model,
+        production_date,
+        km,
+        item.get('hand', {"id": 0})["id"],
+        current_date,  # createdAt - not available in this data structure
+        current_date,  # updatedAt - not available in this data structure
+        current_date,  # rebouncedAt - not available in this data structure
+        listing_type,
+        round(years_since_production, 2),
+        km_per_year,
+        description,
+        f'https://www.yad2.co.il/vehicles/item/{token}',
+        make,
+        hp,
+    )
+    return row
+
+def _row_is_utf8(row: tuple) -> bool:
+    """Check that every text field of a row can be written to the UTF-8 CSV"""
+    try:
+        '\x1f'.join(field for field in row if isinstance(field, str)).encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def _rows_fast(json_list: List[Dict], listing_type: str, current_date: str, now_ordinal: int,
+               check_text: bool = False) -> List[tuple]:
+    """Build rows, silently skipping items that cannot be processed"""
+    rows = []
+    for item in json_list:
+        try:
+            row = _row_from_item(item, listing_type, current_date, now_ordinal)
+        except Exception:
+            continue
+        if row is not None and (not check_text or _row_is_utf8(row)):
+            rows.append(row)
+    return rows
+
+def _rows_debug(json_list: List[Dict], listing_type: str, current_date: str, now_ordinal: int,
+                check_text: bool = False) -> List[tuple]:
+    """Build rows, reporting each item that cannot be processed"""
+    rows = []
+    for item in json_list:
+        try:
+            ad_number = item.get('orderId', item.get('token', 'unknown'))
+            row = _row_from_item(item, listing_type, current_date, now_ordinal)
+            if row is None:
+                continue
+            if check_text and not _row_is_utf8(row):
+                # ascii() because the ad number itself may hold the bad text
+                print(f"Skipping item {ascii(ad_number)} due to text that is not valid UTF-8")
+                continue
+            rows.append(row)
+        except KeyError as e:
+            print(f"Skipping item {ad_number} due to missing key: {e}")
+        except Exception as e:
+            print(f"Error processing item {ad_number}: {e}")
+    return rows
+
+def build_vehicle_rows(json_list: List[Dict], listing_type: str, debug: bool = False,
+                       check_text: bool = False) -> List[tuple]:
+    """Convert vehicle listings into CSV rows ordered like HEADERS
+
+    Set check_text when the listings may hold lone surrogates (stdlib JSON
+    fallback); rows that cannot be written as UTF-8 are then skipped.
+    """
     
     # Debug mode: inspect first item
     if debug and json_list:
@@ -54,105 +219,46 @@ def process_vehicle_data(json_list: List[Dict], listing_type: str, output_file:
                 print(f"  {key}: {type(value).__name__} = {value if not isinstance(value, str) or len(str(value)) < 50 else str(value)[:50] + '...'}")
         print(f"{'='*60}\n")
     
-    # Define the headers we want to extract
-    headers = ['adNumber', 'price', 'city', 'adType', 'model', 'subModel', 
-              'productionDate', 'km', 'hand', 'createdAt', 'updatedAt', 
-              'rebouncedAt', 'listingType', 'number_of_years', 'km_per_year', 'description', 'link', 'make', 'hp']
+    # Take the clock once per batch rather than once per item
+    now = datetime.now()
+    # Use current date as placeholder for missing date fields
+    current_date = now.strftime('%Y-%m-%d')
+    now_ordinal = now.toordinal()
     
-    # Open the CSV file for writing
-    with open(output_file, mode, newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=headers)
-        if mode == 'w':  # Only write header if we're creating a new file
-            writer.writeheader()
-        
-        processed_count = 0
-        # Process each JSON object
-        for item in json_list:
-            try:
-                # Get ad number - use orderId as fallback
-                ad_number = item.get('orderId', item.get('token', 'unknown'))
-                
-                # Skip if price is 0 or missing (likely "contact dealer" listings)
-                if 'price' not in item or item['price'] == 0:
-                    continue
-                
-                # Skip if required vehicle fields are missing
-                required_fields = ['manufacturer', 'model', 'subModel', 'vehicleDates', 'token']
-                if not all(field in item for field in required_fields):
-                    continue
-                
-                # Create date string in YYYY-MM-DD format for production date
-                year = item['vehicleDates']['yearOfProduction']
-                month_data = item['vehicleDates'].get('monthOfProduction', {"text": "ינואר"})
-                month = get_month_number(month_data.get('text', 'ינואר'))
-                production_date = f"{year}-{month:02d}-01"
-                
-                # Calculate years since production
-                years_since_production = calculate_years_since_production(year, month)
-                
-                # Handle missing km field - use 0 as default
-                # Note: km field doesn't exist in this data structure
-                km = item.get('km', 0)
-                
-                # Calculate km per year (handle division by zero)
-                if years_since_production > 0 and km > 0:
-                    km_per_year = round(km / years_since_production, 2)
-                else:
-                    km_per_year = 0
-                
-                # Extract HP from subModel text
-                hp_match = re.search(r'(\d+)\s*כ״ס', item['subModel']['text'])
-                hp = int(hp_match.group(1)) if hp_match else 0
-                
-                # Get city - handle different address structures
-                city = ''
-                if 'address' in item:
-                    if 'city' in item['address']:
-                        city = item['address']['city'].get('text', '')
-                    elif 'area' in item['address']:
-                        city = item['address']['area'].get('text', '')
-                
-                # Get description from metaData if available
-                description = ''
-                if 'metaData' in item and 'description' in item['metaData']:
-                    description = item['metaData']['description']
-                
-                # Use current date as placeholder for missing date fields
-                current_date = datetime.now().strftime('%Y-%m-%d')
-                
-                row = {
-                    'adNumber': ad_number,
-                    'price': item['price'],
-                    'city': city,
-                    'adType': item.get('adType', ''),
-                    'model': item['model']['text'],
-                    'subModel': item['subModel']['text'],
-                    'hp': hp,
-                    'make': item['manufacturer']['text'],
-                    'productionDate': production_date,
-                    'km': km,
-                    'hand': item.get('hand', {"id": 0})["id"],
-                    'createdAt': current_date,  # Not available in this data structure
-                    'updatedAt': current_date,  # Not available in this data structure
-                    'rebouncedAt': current_date,  # Not available in this data structure
-                    'listingType': listing_type,
-                    'number_of_years': round(years_since_production, 2),
-                    'km_per_year': km_per_year,
-                    'description': description,
-                    'link': f'https://www.yad2.co.il/vehicles/item/{item["token"]}',
-                }
-                writer.writerow(row)
-                processed_count += 1
-            except KeyError as e:
-                if debug:
-                    print(f"Skipping item {ad_number} due to missing key: {e}")
-            except Exception as e:
-                if debug:
-                    print(f"Error processing item {ad_number}: {e}")
-        
-        # Report how many items were actually processed
-        if processed_count > 0:
-            print(f"✓ Successfully processed {processed_count} valid items")
+    # Pick the loop once so the common path carries no debug checks
+    if debug:
+        return _rows_debug(json_list, listing_type, current_date, now_ordinal, check_text)
+    return _rows_fast(json_list, listing_type, current_date, now_ordinal, check_text)
+
+def write_vehicle_rows(rows: List[tuple], writer) -> None:
+    """Write CSV rows through an open csv writer"""
+    writer.writerows(rows)
+    
+    # Report how many items were actually processed
+    if rows:
+        print(f"✓ Successfully processed {len(rows)} valid items")
+
+def process_vehicle_data(json_list: List[Dict], listing_type: str, writer, debug: bool = False) -> None:
+    """Process vehicle data and write to CSV"""
+    # The caller's decoder is unknown, so always check the text is writable
+    rows = build_vehicle_rows(json_list, listing_type, debug=debug, check_text=True)
+    write_vehicle_rows(rows, writer)
+
+def _parse_file(file_path: str, debug: bool = False) -> List[List[tuple]]:
+    """Parse one HTML file into CSV rows, one list per listing type present"""
+    html_content = Path(file_path).read_bytes()
+    data, used_fallback = _decode_next_data(html_content)
+    listings_data = _listings_from_data(data)
+    del data  # Drop the rest of the page state before building rows
+    
+    batches = []
+    for listing_type in LISTING_TYPES:
+        json_list = listings_data.get(listing_type, [])
+        if json_list:
+            batches.append(build_vehicle_rows(json_list, listing_type, debug=debug,
+                                              check_text=used_fallback))
+            debug = False  # Only debug first batch
+    return batches
 
 def process_directory(directory_path: str, debug: bool = False) -> None:
     """Process all HTML files in a directory and combine the data"""
@@ -161,42 +267,34 @@ def process_directory(directory_path: str, debug: bool = False) -> None:
     output_file = f"{dir_name}_summary.csv"
     output_path = os.path.join(directory_path, output_file)
     
-    # Process each HTML file in the directory
-    for filename in os.listdir(directory_path):
-        if filename.endswith('.html') and today in filename:
-            file_path = os.path.join(directory_path, filename)
+    # Collect today's HTML files up front, then read each one in a single call
+    with os.scandir(directory_path) as it:
+        entries = [entry for entry in it
+                   if entry.is_file() and entry.name.endswith('.html') and today in entry.name]
+    
+    if not entries:
+        print(f"No HTML files from today found in {directory_path}")
+        return
+    
+    # Parse files in worker processes; only this process writes the CSV,
+    # through a single handle that stays open for the whole run
+    with open(output_path, 'w', newline='', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as csvfile, \
+         ProcessPoolExecutor() as executor:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADERS)
+        
+        futures = {}
+        for entry in entries:
+            futures[executor.submit(_parse_file, entry.path, debug)] = entry.name
+            debug = False  # Only debug first file
+        
+        for future in as_completed(futures):
+            filename = futures[future]
             try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    print(f"Processing {filename}...")
-                    html_content = file.read()
-                    data = extract_json_from_html(html_content)
-                    listings_data = data['props']['pageProps']['dehydratedState']['queries'][0]['state']['data']
-                    
-                    # Process commercial listings
-                    commercial_list = listings_data.get('commercial', [])
-                    if commercial_list:
-                        mode = 'a' if os.path.exists(output_path) else 'w'
-                        process_vehicle_data(commercial_list, 'commercial', output_path, mode, debug=debug)
-                        debug = False  # Only debug first batch
-                    
-                    # Process private listings
-                    private_list = listings_data.get('private', [])
-                    if private_list:
-                        mode = 'a' if os.path.exists(output_path) else 'w'
-                        process_vehicle_data(private_list, 'private', output_path, mode)
-                    
-                    # Process solo listings
-                    solo_list = listings_data.get('solo', [])
-                    if solo_list:
-                        mode = 'a' if os.path.exists(output_path) else 'w'
-                        process_vehicle_data(solo_list, 'solo', output_path, mode)
-                    
-                    # Process platinum listings
-                    platinum_list = listings_data.get('platinum', [])
-                    if platinum_list:
-                        mode = 'a' if os.path.exists(output_path) else 'w'
-                        process_vehicle_data(platinum_list, 'platinum', output_path, mode)
-                    
+                batches = future.result()
+                print(f"Writing rows from {filename}...")
+                for rows in batches:
+                    write_vehicle_rows(rows, writer)
             except Exception as e:
                 print(f"Error processing {filename}: {e}")
     